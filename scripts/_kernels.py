@@ -0,0 +1,177 @@
+"""
+Kernels module
+Provides JIT-compiled collision and ray marching kernels, used when numba is installed
+"""
+
+import os
+import numpy as np
+try:
+    import scripts.geometry as geometry
+except ModuleNotFoundError:
+    import geometry
+
+# The viewer windows are forked processes, after which numba's TBB threading layer deadlocks the main process at exit, so it is tried last unless chosen otherwise
+os.environ.setdefault("NUMBA_THREADING_LAYER_PRIORITY", "omp workqueue tbb")
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """
+        Stand-in for numba.njit when numba is not installed, leaves functions uncompiled.
+        """
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
+
+try:
+    from numba import cuda
+    CUDA_AVAILABLE = cuda.is_available()
+except ImportError:
+    CUDA_AVAILABLE = False
+
+# Primitive kinds of the packed shape arrays
+CIRCLE = 0
+RECTANGLE = 1
+
+def _march_beam(beam: int, first_hits: np.ndarray, kinds: np.ndarray, params: np.ndarray, columns: np.ndarray, bounds: np.ndarray, step_ranges: np.ndarray, opaque: np.ndarray,
+                self_x: float, self_y: float, cos_a: np.ndarray, sin_a: np.ndarray, distances: np.ndarray) -> None:
+    """
+    Marches a single beam through the packed shapes, recording the first step at which each group is hit.
+
+    Plain Python compiled for both the CPU and the CUDA kernels, which only differ in how they assign beams. Takes the same arguments as raymarch, and the index of the beam.
+    """
+    # Last step that can still be seen, starting from the hits already filled in
+    limit = distances.shape[0] - 1
+    for column in range(opaque.shape[0]):
+        if opaque[column]:
+            limit = min(limit, first_hits[beam, column])
+    for shape in range(kinds.shape[0]):
+        column = columns[shape]
+        for step in range(step_ranges[beam, column, 0], min(step_ranges[beam, column, 1], limit) + 1):
+            if step >= first_hits[beam, column]:
+                break
+            x = self_x + distances[step] * cos_a[beam]
+            y = self_y + distances[step] * sin_a[beam]
+            if not (bounds[column, 0] <= x <= bounds[column, 2] and bounds[column, 1] <= y <= bounds[column, 3]):
+                continue
+            if kinds[shape] == CIRCLE:
+                # Circles are (x, y, radius squared)
+                hit = (x - params[shape, 0]) ** 2 + (y - params[shape, 1]) ** 2 <= params[shape, 2]
+            else:
+                # Rectangles are (x, y, cos, sin, half width, half height), the point being rotated into the rectangle's frame
+                translated_x = x - params[shape, 0]
+                translated_y = y - params[shape, 1]
+                rotated_x = translated_x * params[shape, 2] - translated_y * params[shape, 3]
+                rotated_y = translated_x * params[shape, 3] + translated_y * params[shape, 2]
+                hit = -params[shape, 4] <= rotated_x <= params[shape, 4] and -params[shape, 5] <= rotated_y <= params[shape, 5]
+            if hit:
+                first_hits[beam, column] = step
+                if opaque[column]:
+                    limit = min(limit, step)
+                break
+
+_march_beam_cpu = njit(fastmath=True, nogil=True)(_march_beam)
+
+@njit(fastmath=True, parallel=True, nogil=True)
+def raymarch(first_hits: np.ndarray, kinds: np.ndarray, params: np.ndarray, columns: np.ndarray, bounds: np.ndarray, step_ranges: np.ndarray, opaque: np.ndarray,
+             self_x: float, self_y: float, cos_a: np.ndarray, sin_a: np.ndarray, distances: np.ndarray) -> None:
+    """
+    Marches all beams through the packed shapes, recording the first step at which each group is hit.
+
+    Each shape is only sampled within the steps at which the beam crosses its group's bounding box, and no further than the group's earliest hit so far.
+    Once a beam hits an opaque group nothing behind it can be seen, so no shape is sampled beyond that step. Shapes should be ordered by distance for this to cut off as early as possible.
+
+    Args:
+        first_hits (np.ndarray): The (beams, groups) output array, initialised to len(distances) for groups that are not hit.
+        kinds (np.ndarray): The kind of each shape, CIRCLE or RECTANGLE.
+        params (np.ndarray): The (shapes, 6) parameters of each shape, see pack_shapes.
+        columns (np.ndarray): The column of the group each shape belongs to.
+        bounds (np.ndarray): The (groups, 4) bounding boxes of the groups.
+        step_ranges (np.ndarray): The (beams, groups, 2) first and last step of each beam within each group's bounding box.
+        opaque (np.ndarray): Whether each group is fully opaque.
+        self_x (float): The x-coordinate the beams are emitted from.
+        self_y (float): The y-coordinate the beams are emitted from.
+        cos_a (np.ndarray): The cosine of each beam's angle.
+        sin_a (np.ndarray): The sine of each beam's angle.
+        distances (np.ndarray): The distances of the ray marching samples.
+    """
+    for beam in prange(len(cos_a)):
+        _march_beam_cpu(beam, first_hits, kinds, params, columns, bounds, step_ranges, opaque, self_x, self_y, cos_a, sin_a, distances)
+
+if CUDA_AVAILABLE:
+    _march_beam_cuda = cuda.jit(device=True, fastmath=True)(_march_beam)
+
+    @cuda.jit
+    def _raymarch_cuda(first_hits, kinds, params, columns, bounds, step_ranges, opaque, self_x, self_y, cos_a, sin_a, distances):
+        """
+        CUDA version of raymarch, each thread marching one beam.
+        """
+        beam = cuda.grid(1)
+        if beam < cos_a.shape[0]:
+            _march_beam_cuda(beam, first_hits, kinds, params, columns, bounds, step_ranges, opaque, self_x, self_y, cos_a, sin_a, distances)
+
+def raymarch_cuda(first_hits: np.ndarray, kinds: np.ndarray, params: np.ndarray, columns: np.ndarray, bounds: np.ndarray, step_ranges: np.ndarray, opaque: np.ndarray,
+                  self_x: float, self_y: float, cos_a: np.ndarray, sin_a: np.ndarray, distances: np.ndarray, threads_per_block: int = 128) -> None:
+    """
+    Marches all beams through the packed shapes on the GPU, one thread per beam. Takes the same arguments as raymarch.
+
+    Args:
+        threads_per_block (int, optional): The number of beams marched per CUDA block. Defaults to 128.
+    """
+    if not CUDA_AVAILABLE:
+        raise RuntimeError("CUDA is not available")
+    device_hits = cuda.to_device(first_hits)
+    # The beam tables are copied to the device explicitly, as numba copies host arrays passed to a kernel back afterwards, which fails for these read-only arrays
+    device_cos, device_sin = cuda.to_device(cos_a), cuda.to_device(sin_a)
+    blocks = (len(cos_a) + threads_per_block - 1) // threads_per_block
+    _raymarch_cuda[blocks, threads_per_block](device_hits, kinds, params, columns, bounds, step_ranges, opaque, self_x, self_y, device_cos, device_sin, distances)
+    cuda.synchronize()
+    device_hits.copy_to_host(first_hits)
+
+def pack_shapes(groups: list[geometry.GeoGroup]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Packs the shapes of geometry groups into flat arrays for the kernels.
+
+    Circles are stored as (x, y, radius squared) and rectangles as (x, y, cos, sin, half width, half height), using the cached inverse rotation.
+    The shapes of nested groups are packed into the column of the group containing them.
+
+    Args:
+        groups (list[geometry.GeoGroup]): The geometry groups, their position in the list becoming their column.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The kinds, (shapes, 6) parameters and group columns of all shapes.
+    """
+    kinds, params, columns = [], [], []
+    for column, group in enumerate(groups):
+        # Stack of shapes still to pack, popped in the order of the group's shapes
+        shapes = list(reversed(group.shapes))
+        while shapes:
+            shape = shapes.pop()
+            if isinstance(shape, geometry.GeoGroup):
+                shapes.extend(reversed(shape.shapes))
+                continue
+            if isinstance(shape, geometry.GeoCircle):
+                kinds.append(CIRCLE)
+                params.append((shape.x, shape.y, shape._r2, 0, 0, 0))
+            elif isinstance(shape, geometry.GeoRectangle):
+                kinds.append(RECTANGLE)
+                params.append((shape.x, shape.y, shape._cos, shape._sin, shape._half_w, shape._half_h))
+            else:
+                raise TypeError(f"Cannot pack shape {shape}")
+            columns.append(column)
+    return np.array(kinds, dtype=np.int64), np.array(params, dtype=np.float64).reshape(-1, 6), np.array(columns, dtype=np.int64)
+
+if NUMBA_AVAILABLE:
+    # Compile the march for the array types render passes at import, so the first frame does not stall on compilation
+    # The beam directions come from the shared beam tables, which are read-only, and numba compiles read-only arrays separately
+    _cos_a, _sin_a = np.ones(1, dtype=np.float32), np.zeros(1, dtype=np.float32)
+    _cos_a.setflags(write=False)
+    _sin_a.setflags(write=False)
+    raymarch(np.zeros((1, 1), dtype=np.int64), np.zeros(1, dtype=np.int64), np.zeros((1, 6)), np.zeros(1, dtype=np.int64),
+             np.zeros((1, 4), dtype=np.float32), np.zeros((1, 1, 2), dtype=np.int64), np.zeros(1, dtype=np.bool_), 0.0, 0.0, _cos_a, _sin_a, np.zeros(1, dtype=np.float32))
+    del _cos_a, _sin_a
@@ -5,11 +5,100 @@ Deals with defining geometry and its functionality
 """
 
 from abc import abstractmethod, ABCMeta
+import math
 import numpy as np
 
 shapes = []
 groups = []
 
+# Structure-of-arrays buffers of all circles, indexed by GeoCircle._slot
+circles_xy = np.zeros((16, 2), dtype=np.float32)
+circles_r2 = np.zeros(16, dtype=np.float32)
+# Index of the group each circle belongs to, -1 for circles outside of groups
+circles_group = np.full(16, -1, dtype=np.intp)
+circle_count = 0
+
+# Incremented whenever a group changes, so spatial indices know when to update
+_index_version = 0
+# Groups changed since spatial indices last updated them
+_dirty_groups = []
+
+def circles_hit_any(xs: np.ndarray, ys: np.ndarray, slots: np.ndarray = None) -> np.ndarray:
+    """
+    Checks which points collide with any circle, testing all circles in one vectorized pass.
+
+    Points are compared in single precision, which is plenty for pixel-sized beams.
+
+    Args:
+        xs (np.ndarray): The x-coordinates of the points to check.
+        ys (np.ndarray): The y-coordinates of the points to check, same shape as xs.
+        slots (np.ndarray, optional): The buffer slots of the circles to check. Defaults to all circles.
+
+    Returns:
+        np.ndarray: A boolean array of the same shape as xs, True where the point collides with any of the circles.
+    """
+    if slots is None:
+        slots = slice(0, circle_count)
+    centers = circles_xy[slots]
+    # Squared distances of every point to every circle center, shape (..., circles)
+    xs = np.asarray(xs, dtype=np.float32)[..., None]
+    ys = np.asarray(ys, dtype=np.float32)[..., None]
+    return ((xs - centers[:, 0]) ** 2 + (ys - centers[:, 1]) ** 2 <= circles_r2[slots]).any(axis=-1)
+
+def ray_circles_distance(x: float, y: float, cos_a: np.ndarray, sin_a: np.ndarray, slots: np.ndarray = None) -> np.ndarray:
+    """
+    Calculates the exact distance at which rays first enter each of the given circles.
+
+    Solves the ray-circle intersection quadratic for all rays and circles at once instead of sampling along the rays.
+
+    Args:
+        x (float): The x-coordinate the rays are emitted from.
+        y (float): The y-coordinate the rays are emitted from.
+        cos_a (np.ndarray): The cosine of each ray's angle.
+        sin_a (np.ndarray): The sine of each ray's angle.
+        slots (np.ndarray, optional): The buffer slots of the circles to intersect. Defaults to all circles.
+
+    Returns:
+        np.ndarray: The (rays, circles) distances along each ray to each circle, 0 if the ray starts inside it, inf if it misses it.
+    """
+    if slots is None:
+        slots = slice(0, circle_count)
+    # Offsets from the ray origin to the circle centers
+    offset_x = circles_xy[slots, 0].astype(float) - x
+    offset_y = circles_xy[slots, 1].astype(float) - y
+    # Distance along each ray to the point closest to each circle center, shape (rays, circles)
+    closest = np.asarray(cos_a, dtype=float)[:, None] * offset_x + np.asarray(sin_a, dtype=float)[:, None] * offset_y
+    discriminant = closest**2 - (offset_x**2 + offset_y**2 - circles_r2[slots])
+    half_chord = np.sqrt(np.maximum(discriminant, 0))
+    # Rays missing a circle, or with the circle entirely behind them, never enter it
+    entered = (discriminant >= 0) & (closest + half_chord >= 0)
+    return np.where(entered, np.maximum(closest - half_chord, 0), np.inf)
+
+def ray_boxes_interval(x: float, y: float, cos_a: np.ndarray, sin_a: np.ndarray, bounds: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calculates the distances at which rays enter and leave axis-aligned boxes, using the slab method.
+
+    Args:
+        x (float): The x-coordinate the rays are emitted from.
+        y (float): The y-coordinate the rays are emitted from.
+        cos_a (np.ndarray): The cosine of each ray's angle.
+        sin_a (np.ndarray): The sine of each ray's angle.
+        bounds (np.ndarray): The (boxes, 4) array of (x_min, y_min, x_max, y_max) boxes.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The (rays, boxes) entry and exit distances, the entry exceeding the exit where a ray misses a box.
+    """
+    bounds = np.asarray(bounds, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inverse_x = 1 / np.asarray(cos_a, dtype=float)[:, None]
+        inverse_y = 1 / np.asarray(sin_a, dtype=float)[:, None]
+        x_near, x_far = (bounds[:, 0] - x) * inverse_x, (bounds[:, 2] - x) * inverse_x
+        y_near, y_far = (bounds[:, 1] - y) * inverse_y, (bounds[:, 3] - y) * inverse_y
+    # fmin and fmax ignore the NaNs of rays running along a box edge, leaving that axis unconstrained
+    entries = np.fmax(np.fmin(x_near, x_far), np.fmin(y_near, y_far))
+    exits = np.fmin(np.fmax(x_near, x_far), np.fmax(y_near, y_far))
+    return entries, exits
+
 class GeoShape(metaclass=ABCMeta):
     """
     Basic geometry class, abstract class for concrete shapes.
@@ -18,11 +107,41 @@ class GeoShape(metaclass=ABCMeta):
         x (float): The x-coordinate of the shape.
         y (float): The y-coordinate of the shape.
     """
+    __slots__ = ('_x', '_y', '_group', '_index')
+
     def __init__(self, x: float, y: float) -> None:
-        self.x = x
-        self.y = y
+        self._x = x
+        self._y = y
+        # The group the shape belongs to, notified of changes
+        self._group = None
 
+        self._index = len(shapes)
         shapes.append(self)
+
+    @property
+    def x(self) -> float:
+        return self._x
+
+    @x.setter
+    def x(self, x: float) -> None:
+        self._x = x
+        self._changed()
+
+    @property
+    def y(self) -> float:
+        return self._y
+
+    @y.setter
+    def y(self, y: float) -> None:
+        self._y = y
+        self._changed()
+
+    def _changed(self) -> None:
+        """
+        Updates state derived from the shape's geometry and notifies the shape's group.
+        """
+        if self._group is not None:
+            self._group._mark_dirty()
     
     @abstractmethod
     def __repr__(self) -> str:
@@ -51,6 +170,19 @@ class GeoShape(metaclass=ABCMeta):
             properties of the shape.
         """
     
+    @abstractmethod
+    def collides_array(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        Checks which points of an array collide with the shape.
+
+        Args:
+            xs (np.ndarray): The x-coordinates of the points to check.
+            ys (np.ndarray): The y-coordinates of the points to check, same shape as xs.
+
+        Returns:
+            np.ndarray: A boolean array of the same shape as xs, True where the point collides with the shape.
+        """
+    
     @abstractmethod
     def bounds(self) -> tuple[float, float, float, float]:
         """
@@ -69,16 +201,47 @@ class GeoCircle(GeoShape):
         y (float): The y-coordinate of the circle.
         r (float): The radius of the circle.
     """
+    __slots__ = ('_slot', '_radius', '_r2')
+
     def __init__(self, x: float, y: float, radius: float) -> None:
+        global circles_xy, circles_r2, circles_group, circle_count
+
+        # Reserve a slot in the circle buffers, growing them geometrically
+        if circle_count == len(circles_xy):
+            circles_xy = np.resize(circles_xy, (2 * circle_count, 2))
+            circles_r2 = np.resize(circles_r2, 2 * circle_count)
+            circles_group = np.resize(circles_group, 2 * circle_count)
+        self._slot = circle_count
+        circles_group[self._slot] = -1
+        circle_count += 1
+
         super().__init__(x, y)
         self.radius = radius
+
+    @property
+    def radius(self) -> float:
+        return self._radius
+
+    @radius.setter
+    def radius(self, radius: float) -> None:
+        self._radius = radius
+        self._r2 = radius**2
+        self._changed()
+
+    def _changed(self):
+        circles_xy[self._slot] = self._x, self._y
+        circles_r2[self._slot] = self._r2
+        super()._changed()
     
     def __repr__(self):
-        return f"[{shapes.index(self)}] GeoCircle(x={self.x}, y={self.y}, radius={self.radius})"
+        return f"[{self._index}] GeoCircle(x={self.x}, y={self.y}, radius={self.radius})"
     
     def collides(self, x, y):
         # Check if the distance between the point and the center of the circle is less than or equal to the radius
-        return (x - self.x) ** 2 + (y - self.y) ** 2 <= self.radius**2
+        return (x - self.x) ** 2 + (y - self.y) ** 2 <= self._r2
+
+    def collides_array(self, xs, ys):
+        return (xs - self.x) ** 2 + (ys - self.y) ** 2 <= self._r2
 
     @property
     def bounds(self):
@@ -95,70 +258,109 @@ class GeoRectangle(GeoShape):
         h (float): The height of the rectangle.
         angle (float): The rotation angle of the rectangle in degrees.
     """
+    __slots__ = ('_width', '_height', '_angle', '_half_w', '_half_h', '_cos', '_sin', '_corners', '_bounds')
+
     def __init__(self, x: float, y: float, width: float, height: float, angle: float = 0) -> None:
         super().__init__(x, y)
         self.width = width
         self.height = height
         self.angle = angle
     
+    @property
+    def width(self) -> float:
+        return self._width
+
+    @width.setter
+    def width(self, width: float) -> None:
+        self._width = width
+        self._half_w = width * 0.5
+        self._changed()
+
+    @property
+    def height(self) -> float:
+        return self._height
+
+    @height.setter
+    def height(self, height: float) -> None:
+        self._height = height
+        self._half_h = height * 0.5
+        self._changed()
+
+    @property
+    def angle(self) -> float:
+        return self._angle
+
+    @angle.setter
+    def angle(self, angle: float) -> None:
+        # Cache the inverse rotation used by collision checks
+        self._angle = angle
+        angle_rad = math.radians(-angle)
+        self._cos = math.cos(angle_rad)
+        self._sin = math.sin(angle_rad)
+        self._changed()
+    
     def __repr__(self):
-        return f"[{shapes.index(self)}] GeoRectangle(x={self.x}, y={self.y}, width={self.width}, height={self.height}, angle={self.angle})"
+        return f"[{self._index}] GeoRectangle(x={self.x}, y={self.y}, width={self.width}, height={self.height}, angle={self.angle})"
     
     @property
-    def corners(self) -> list[tuple[float, float]]:
+    def corners(self) -> tuple[tuple[float, float], ...]:
         """
         Returns the coordinates of all corners of the rectangle in global space.
 
+        The corners are computed on first access and cached until the rectangle changes.
+
         Returns:
-            list[tuple[float, float]]: A list of (x, y) tuples representing the rectangle's corners.
-        """
-        # Half-dimensions for convenience
-        half_w = self.width / 2
-        half_h = self.height / 2
-
-        # Define corners relative to the rectangle's center in local space
-        local_corners = [
-            (-half_w, -half_h),  # Bottom-left
-            (half_w, -half_h),   # Bottom-right
-            (half_w, half_h),    # Top-right
-            (-half_w, half_h)    # Top-left
-        ]
-
-        # Angle in radians
-        angle_rad = np.deg2rad(self.angle)
-
-        # Rotate and translate corners to global space
-        global_corners = []
-        for lx, ly in local_corners:
-            gx = self.x + (lx * np.cos(angle_rad) - ly * np.sin(angle_rad))
-            gy = self.y + (lx * np.sin(angle_rad) + ly * np.cos(angle_rad))
-            global_corners.append((gx, gy))
-
-        return global_corners
+            tuple[tuple[float, float], ...]: The (x, y) tuples of the rectangle's corners.
+        """
+        if self._corners is None:
+            # Half-dimensions for convenience
+            half_w = self._half_w
+            half_h = self._half_h
+
+            # Rotation of the rectangle, the cached values belong to the inverse rotation
+            cos_a, sin_a = self._cos, -self._sin
+
+            # Rotate and translate the bottom-left, bottom-right, top-right and top-left corners to global space
+            self._corners = tuple(
+                (self.x + lx * cos_a - ly * sin_a, self.y + lx * sin_a + ly * cos_a)
+                for lx, ly in ((-half_w, -half_h), (half_w, -half_h), (half_w, half_h), (-half_w, half_h))
+            )
+
+        return self._corners
     
     def collides(self, x, y) -> bool:
         # Translate point to rectangle's local space
         translated_x = x - self.x
         translated_y = y - self.y
 
-        # Convert angle to radians
-        angle_rad = np.deg2rad(-self.angle)
-
         # Rotate point in the opposite direction
-        rotated_x = (
-            translated_x * np.cos(angle_rad) - translated_y * np.sin(angle_rad)
-        )
-        rotated_y = (
-            translated_x * np.sin(angle_rad) + translated_y * np.cos(angle_rad)
-        )
+        rotated_x = translated_x * self._cos - translated_y * self._sin
+        rotated_y = translated_x * self._sin + translated_y * self._cos
 
         # Check if the point is within the unrotated rectangle
-        half_w, half_h = self.width / 2, self.height / 2
-        return -half_w <= rotated_x <= half_w and -half_h <= rotated_y <= half_h
+        return -self._half_w <= rotated_x <= self._half_w and -self._half_h <= rotated_y <= self._half_h
+
+    def collides_array(self, xs, ys):
+        # Same as collides, applied to whole arrays of points at once
+        translated_x = xs - self.x
+        translated_y = ys - self.y
+
+        rotated_x = translated_x * self._cos - translated_y * self._sin
+        rotated_y = translated_x * self._sin + translated_y * self._cos
+
+        return (np.abs(rotated_x) <= self._half_w) & (np.abs(rotated_y) <= self._half_h)
 
     @property
     def bounds(self):
-        return min(c[0] for c in self.corners), min(c[1] for c in self.corners), max(c[0] for c in self.corners), max(c[1] for c in self.corners)
+        if self._bounds is None:
+            xs, ys = zip(*self.corners)
+            self._bounds = min(xs), min(ys), max(xs), max(ys)
+        return self._bounds
+
+    def _changed(self):
+        self._corners = None
+        self._bounds = None
+        super()._changed()
 
 class GeoGroup(GeoShape):
     """
@@ -168,34 +370,120 @@ class GeoGroup(GeoShape):
         x (float): The x-coordinate of the group.
         y (float): The y-coordinate of the group.
         shapes (list[GeoShape]): A list of shapes that make up the group. Their positions are relative to the group's position.
+        circles (list[GeoCircle]): The circles among the group's shapes.
+        rectangles (list[GeoRectangle]): The rectangles among the group's shapes.
     """
+    __slots__ = ('shapes', 'circles', 'rectangles', '_circle_slots', '_other_shapes', '_dirty', '_bounds', '_child_bounds')
+
     def __init__(self, x: float, y: float, *shapes: GeoShape) -> None:
-        self.x = x
-        self.y = y
+        self._x = x
+        self._y = y
+        # The group the group is nested in, notified of changes
+        self._group = None
         self.shapes = shapes
 
         # Update shapes' positions to be relative to the group
         for shape in shapes:
             shape.x += x
             shape.y += y
+            shape._group = self
+
+        # Shapes bucketed by type, so users can handle each type in its own loop
+        self.circles = [shape for shape in shapes if type(shape) == GeoCircle]
+        self.rectangles = [shape for shape in shapes if type(shape) == GeoRectangle]
 
+        # Circles are tested together through the circle buffers, other shapes one by one
+        self._circle_slots = np.array([shape._slot for shape in shapes if isinstance(shape, GeoCircle)], dtype=np.intp)
+        self._other_shapes = [shape for shape in shapes if not isinstance(shape, GeoCircle)]
+
+        self._index = len(groups)
         groups.append(self)
+        circles_group[self._circle_slots] = self._index
+
+        self._bounds = None
+        self._child_bounds = None
+        self._dirty = False
+        self._mark_dirty()
+
+    @property
+    def x(self) -> float:
+        return self._x
+
+    @x.setter
+    def x(self, x: float) -> None:
+        # Move the shapes along with the group
+        for shape in self.shapes:
+            shape.x += x - self._x
+        self._x = x
+        self._mark_dirty()
+
+    @property
+    def y(self) -> float:
+        return self._y
+
+    @y.setter
+    def y(self, y: float) -> None:
+        for shape in self.shapes:
+            shape.y += y - self._y
+        self._y = y
+        self._mark_dirty()
+
+    def _mark_dirty(self) -> None:
+        """
+        Marks the group and the groups it is nested in as changed, so spatial indices update them.
+        """
+        global _index_version
+        self._bounds = None
+        self._child_bounds = None
+        if not self._dirty:
+            self._dirty = True
+            _dirty_groups.append(self)
+        _index_version += 1
+        if self._group is not None:
+            self._group._mark_dirty()
     
     def __repr__(self):
-        return f"[{groups.index(self)}] GeoGroup(x={self.x}, y={self.y}, shapes={self.shapes})"
+        return f"[{self._index}] GeoGroup(x={self.x}, y={self.y}, shapes={self.shapes})"
     
     def collides(self, x, y):
-        for shape in self.shapes:
-            if shape.collides(x, y):
+        # Only test the shapes whose bounding box contains the point
+        child_bounds = self.child_bounds
+        inside = (child_bounds[:, 0] <= x) & (x <= child_bounds[:, 2]) & (child_bounds[:, 1] <= y) & (y <= child_bounds[:, 3])
+        for index in np.flatnonzero(inside):
+            if self.shapes[index].collides(x, y):
                 return True
         return False
 
+    def collides_array(self, xs, ys):
+        if len(self._circle_slots):
+            mask = circles_hit_any(xs, ys, self._circle_slots)
+        else:
+            mask = np.zeros(np.shape(xs), dtype=bool)
+        for shape in self._other_shapes:
+            mask |= shape.collides_array(xs, ys)
+        return mask
+
     @property
     def bounds(self):
-        x_min, y_min, x_max, y_max = 0, 0, 0, 0
-        for shape in self.shapes:
-            x_min, y_min, x_max, y_max = min(x_min, shape.bounds[0]), min(y_min, shape.bounds[1]), max(x_max, shape.bounds[2]), max(y_max, shape.bounds[3])
-        return x_min, y_min, x_max, y_max
+        if self._bounds is None:
+            if self.shapes:
+                shape_bounds = [shape.bounds for shape in self.shapes]
+                self._bounds = min(b[0] for b in shape_bounds), min(b[1] for b in shape_bounds), max(b[2] for b in shape_bounds), max(b[3] for b in shape_bounds)
+            else:
+                self._bounds = self.x, self.y, self.x, self.y
+        return self._bounds
+
+    @property
+    def child_bounds(self) -> np.ndarray:
+        """
+        Gets the bounding boxes of the group's shapes.
+
+        Returns:
+            np.ndarray: The (shapes, 4) array of (x_min, y_min, x_max, y_max) bounding boxes, in the order of the shapes.
+        """
+        if self._child_bounds is None:
+            self._child_bounds = np.array([shape.bounds for shape in self.shapes], dtype=float).reshape(-1, 4)
+        return self._child_bounds
 
 if __name__ == "__main__":
     circle = GeoCircle(0, 0, 1)
@@ -226,3 +514,13 @@ if __name__ == "__main__":
     print(group.collides(-1, 1))
     print(group.collides(1, 1))
     print(group.collides(2, 1))
+
+    # Moving a shape inside a nested group updates the cached bounds of the groups enclosing it
+    inner = GeoGroup(0, 0, GeoCircle(0, 0, 1))
+    outer = GeoGroup(5, 0, inner)
+    inner.shapes[0].x = 50
+    assert outer.bounds == (49, -1, 51, 1)
+    assert outer.collides(50, 0)
+    outer.x = 20
+    assert outer.bounds == (64, -1, 66, 1)
+    assert outer.collides(65, 0) and not outer.collides(50, 0)
@@ -4,17 +4,41 @@ Graphics module
 Deals with graphical representation of geometry, including cameras
 """
 
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import pygame as pg
 import numpy as np
 try:
     import scripts.geometry as geometry
-    import scripts.utils as utils
+    import scripts.quadtree as quadtree
+    import scripts._kernels as _kernels
 except ModuleNotFoundError:
     import geometry
-    import utils
+    import quadtree
+    import _kernels
 
 # Dictionary of colors for groups, indexed by group index
 group_colors = {}
+# The (group index, color) items of group_colors sorted by descending alpha, kept in sync with group_colors
+_group_colors_by_alpha = []
+# RGBA colors of all groups as rows of an array, indexed by group index, kept in sync with group_colors
+_color_array = np.zeros((16, 4), dtype=np.uint8)
+# Whether each group has a color, indexed by group index, kept in sync with group_colors
+_colored_mask = np.zeros(16, dtype=bool)
+
+# Worker threads for the uncompiled ray march, numpy releasing the GIL during its array operations, created by _worker_pool on first use
+_pool = None
+
+# Spatial index of the colored groups, shared by all cameras
+_spatial_index = None
+# geometry._index_version the spatial index is up to date with
+_spatial_index_version = -1
+# Bounds each group was inserted into the spatial index with, indexed by group index
+_indexed_bounds = {}
+# The same bounds as rows of an array, indexed by group index, for vectorized broad phase tests against the single precision samples
+_bounds_array = np.zeros((16, 4), dtype=np.float32)
 
 def color_group(group_index: int|geometry.GeoGroup, color: tuple[int, int, int, int]) -> None:
     """
@@ -24,13 +48,37 @@ def color_group(group_index: int|geometry.GeoGroup, color: tuple[int, int, int,
         group_index (int|geometry.GeoGroup): The index of the group or the group object.
         color (tuple[int, int, int, int]): The RGBA color to set.
     """
-    if group_index in geometry.groups or 0 <= group_index < len(geometry.groups):
-        if type(group_index) == geometry.GeoGroup:
-            group_index = geometry.groups.index(group_index)
+    if isinstance(group_index, geometry.GeoGroup):
+        group_index = group_index._index
+    if 0 <= group_index < len(geometry.groups):
         group_colors[group_index] = (color[0], color[1], color[2], color[3])
+        if group_index >= len(_color_array):
+            _grow_color_array(len(geometry.groups))
+        _color_array[group_index] = group_colors[group_index]
+        _colored_mask[group_index] = True
+        _sort_group_colors()
+        geometry.groups[group_index]._mark_dirty()
     else:
         raise ValueError("Invalid group index")
 
+def _grow_color_array(size: int) -> None:
+    """
+    Grows the color array and colored mask geometrically until they have at least the given number of rows.
+
+    Args:
+        size (int): The number of rows required.
+    """
+    global _color_array, _colored_mask
+    rows = len(_color_array)
+    while rows < size:
+        rows *= 2
+    grown = np.zeros((rows, 4), dtype=np.uint8)
+    grown[:len(_color_array)] = _color_array
+    _color_array = grown
+    grown_mask = np.zeros(rows, dtype=bool)
+    grown_mask[:len(_colored_mask)] = _colored_mask
+    _colored_mask = grown_mask
+
 def uncolor_group(group_index: int|geometry.GeoGroup) -> None:
     """
     Removes the color of a group.
@@ -38,10 +86,20 @@ def uncolor_group(group_index: int|geometry.GeoGroup) -> None:
     Args:
         group_index (int|geometry.GeoGroup): The index of the group or the group object.
     """
-    if type(group_index) == geometry.GeoGroup:
-        group_index = geometry.groups.index(group_index)
+    if isinstance(group_index, geometry.GeoGroup):
+        group_index = group_index._index
     if group_index in group_colors:
         del group_colors[group_index]
+        _colored_mask[group_index] = False
+        _sort_group_colors()
+        geometry.groups[group_index]._mark_dirty()
+
+def _sort_group_colors() -> None:
+    """
+    Re-sorts the group colors by descending alpha after they changed.
+    """
+    global _group_colors_by_alpha
+    _group_colors_by_alpha = sorted(group_colors.items(), key=lambda x: x[1][3], reverse=True)
 
 def get_uncolored() -> list[int]:
     """
@@ -50,7 +108,92 @@ def get_uncolored() -> list[int]:
     Returns:
         list[int]: A list of indices of uncolored groups.
     """
-    return [i for i in range(len(geometry.groups)) if i not in group_colors]
+    if len(_colored_mask) < len(geometry.groups):
+        _grow_color_array(len(geometry.groups))
+    return np.flatnonzero(~_colored_mask[:len(geometry.groups)]).tolist()
+
+def _worker_pool() -> ThreadPoolExecutor:
+    """
+    Gets the worker threads for the uncompiled ray march, starting them on first use so processes using the compiled kernels never do.
+
+    Returns:
+        ThreadPoolExecutor: The shared worker threads.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+    return _pool
+
+def _update_spatial_index() -> quadtree.PRQuadtree:
+    """
+    Brings the spatial index of the colored groups up to date with the scene.
+
+    Only groups changed since the last update are removed and reinserted. The index is rebuilt from scratch when a changed group left the region it covers.
+
+    Returns:
+        quadtree.PRQuadtree: The spatial index of the colored groups.
+    """
+    global _spatial_index, _spatial_index_version, _indexed_bounds, _bounds_array
+    if _spatial_index is not None and _spatial_index_version == geometry._index_version:
+        return _spatial_index
+
+    dirty_groups = list(geometry._dirty_groups)
+    geometry._dirty_groups.clear()
+    for group in dirty_groups:
+        group._dirty = False
+    dirty_bounds = {group._index: group.bounds for group in dirty_groups if group._index in group_colors}
+
+    if _spatial_index is None or not all(_spatial_index.contains(bounds) for bounds in dirty_bounds.values()):
+        _indexed_bounds = {group_index: geometry.groups[group_index].bounds for group_index in group_colors}
+        _spatial_index = quadtree.PRQuadtree((
+            min((bounds[0] for bounds in _indexed_bounds.values()), default=0),
+            min((bounds[1] for bounds in _indexed_bounds.values()), default=0),
+            max((bounds[2] for bounds in _indexed_bounds.values()), default=0),
+            max((bounds[3] for bounds in _indexed_bounds.values()), default=0),
+        ))
+        for group_index, bounds in _indexed_bounds.items():
+            _spatial_index.insert(geometry.groups[group_index], bounds)
+    else:
+        for group in dirty_groups:
+            if group._index in _indexed_bounds:
+                _spatial_index.remove(group, _indexed_bounds.pop(group._index))
+            if group._index in dirty_bounds:
+                _indexed_bounds[group._index] = dirty_bounds[group._index]
+                _spatial_index.insert(group, dirty_bounds[group._index])
+
+    if len(_bounds_array) < len(geometry.groups):
+        _bounds_array = np.zeros((max(len(geometry.groups), 2 * len(_bounds_array)), 4), dtype=np.float32)
+        dirty_bounds = _indexed_bounds
+    for group_index, bounds in dirty_bounds.items():
+        # Round outwards, so the boxes never shrink through the loss of precision
+        bounds = np.array(bounds, dtype=np.float32)
+        _bounds_array[group_index, :2] = np.nextafter(bounds[:2], np.float32(-np.inf))
+        _bounds_array[group_index, 2:] = np.nextafter(bounds[2:], np.float32(np.inf))
+
+    _spatial_index_version = geometry._index_version
+    return _spatial_index
+
+@lru_cache(maxsize=64)
+def _beam_table(direction: float, field_of_view: float, resolution: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calculates the angles and unit direction vectors of the beams of a camera.
+
+    Tables are shared between cameras and kept for recently used headings, so turning back and forth in fixed increments reuses them.
+
+    Args:
+        direction (float): The direction of the camera in degrees.
+        field_of_view (float): The field of view of the camera in degrees.
+        resolution (int): The number of beams.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The angles in degrees, and their cosines and sines. They are shared between cameras and read-only.
+    """
+    angles = np.linspace(direction - field_of_view / 2, direction + field_of_view / 2, resolution, dtype=np.float32)
+    angles_rad = np.deg2rad(angles)
+    table = angles, np.cos(angles_rad), np.sin(angles_rad)
+    for array in table:
+        array.setflags(write=False)
+    return table
 
 class Camera:
     """
@@ -62,106 +205,260 @@ class Camera:
         direction (float): The direction of the camera in degrees.
         field_of_view (float): The field of view of the camera in degrees.
         resolution (int): The resolution/width of the cameras viewport in pixels.
+        backend (str): Where beams are marched, "cpu" or "cuda".
     """
-    def __init__(self, x: float, y: float, direction: float, field_of_view: float, resolution: int) -> None:
+    __slots__ = ('x', 'y', '_direction', '_field_of_view', '_resolution', 'backend', 'viewport', '_pixels', '_beam_angles', '_beam_directions')
+
+    def __init__(self, x: float, y: float, direction: float, field_of_view: float, resolution: int, backend: str = "cpu") -> None:
         self.x = x
         self.y = y
+        if backend not in ("cpu", "cuda"):
+            raise ValueError("Invalid backend")
+        if backend == "cuda" and not _kernels.CUDA_AVAILABLE:
+            raise ValueError("CUDA backend is not available")
+        self.backend = backend
+        # Beam angles and directions are computed on first use and cached until direction, field of view or resolution change
+        self._beam_angles = None
+        self._beam_directions = None
         self.direction = direction
         self.field_of_view = field_of_view
         self.resolution = resolution
 
         self.viewport = pg.Surface((self.resolution, 1), pg.SRCALPHA)
+        # The viewport is opaque, blitting colors leaves its alpha untouched so it is only set once
+        pg.surfarray.pixels_alpha(self.viewport)[:] = 255
+        # RGB pixels of the viewport, composited in render and blitted once per frame
+        self._pixels = np.zeros((self.resolution, 1, 3), dtype=np.uint8)
+
+    @property
+    def direction(self) -> float:
+        return self._direction
+
+    @direction.setter
+    def direction(self, direction: float) -> None:
+        if getattr(self, "_direction", None) != direction:
+            self._direction = direction
+            self._beam_angles = None
+            self._beam_directions = None
+
+    @property
+    def field_of_view(self) -> float:
+        return self._field_of_view
+
+    @field_of_view.setter
+    def field_of_view(self, field_of_view: float) -> None:
+        if getattr(self, "_field_of_view", None) != field_of_view:
+            self._field_of_view = field_of_view
+            self._beam_angles = None
+            self._beam_directions = None
+
+    @property
+    def resolution(self) -> int:
+        return self._resolution
+
+    @resolution.setter
+    def resolution(self, resolution: int) -> None:
+        if getattr(self, "_resolution", None) != resolution:
+            self._resolution = resolution
+            self._beam_angles = None
+            self._beam_directions = None
     
     @property
-    def beam_angles(self) -> list[float]:
+    def beam_angles(self) -> np.ndarray:
         """
         Calculates the angles of beams emitted by the camera across its field of view.
 
+        The angles are cached until the camera's direction, field of view or resolution change, and looked up from the shared beam tables when they do.
+
         Returns:
-            list[float]: A list of angles in degrees, representing the global direction of each beam, evenly spaced across the camera's field of view.
+            np.ndarray: The angles in degrees, one per pixel, representing the global direction of each beam, evenly spaced across the camera's field of view.
         """
-        angle_per_pixel = self.field_of_view / (self.resolution - 1)
-        return [*(self.direction + angle for angle in np.arange(-self.field_of_view / 2, self.field_of_view / 2, angle_per_pixel)), self.direction + self.field_of_view / 2]
+        if self._beam_angles is None:
+            self._beam_angles = _beam_table(self.direction, self.field_of_view, self.resolution)[0]
+        return self._beam_angles
 
-    def detailed_distance(self, group: geometry.GeoGroup, distance: float, angle: float, step_size: float, step_size_threshold: float) -> float:
+    @property
+    def beam_directions(self) -> tuple[np.ndarray, np.ndarray]:
         """
-        Calculates a more precise collision distance by recursively adjusting the step size.
+        Calculates the unit direction vectors of the beams emitted by the camera.
 
-        This function checks for collisions at increasing levels of detail by recursively halving the step size. It returns the distance at which a collision occurs or when the step size is below a threshold.
+        The directions are cached along with the beam angles.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The cosine and sine of each beam's angle.
+        """
+        if self._beam_directions is None:
+            self._beam_directions = _beam_table(self.direction, self.field_of_view, self.resolution)[1:]
+        return self._beam_directions
+
+    def detailed_distance(self, group: geometry.GeoGroup, distance: np.ndarray, cos_a: np.ndarray, sin_a: np.ndarray, step_size: float, step_size_threshold: float) -> np.ndarray:
+        """
+        Calculates more precise collision distances by bisecting the last ray marching step of several beams at once.
+
+        This function performs a binary search between the previous sample (distance - step_size) and the colliding sample (distance), with a fixed number of halvings that bring the search interval below a threshold. Each halving tests all beams in one vectorized call. It returns the closest distances known to collide.
 
         Args:
             group (geometry.GeoGroup): The geometry group to check for collisions.
-            distance (float): The current distance to check for collisions.
-            angle (float): The angle in degrees at which the beam is emitted.
-            step_size (float): The current step size for ray marching.
-            step_size_threshold (float, optional): The threshold below which the step size is considered sufficiently detailed. Defaults to the detailisation value.
+            distance (np.ndarray): The distances at which collisions were detected.
+            cos_a (np.ndarray): The cosine of the angle of each beam.
+            sin_a (np.ndarray): The sine of the angle of each beam.
+            step_size (float): The step size used for ray marching.
+            step_size_threshold (float): The interval size below which the distance is considered sufficiently detailed.
 
         Returns:
-            float: The distance at which a collision is detected or when the step size threshold is reached.
+            np.ndarray: The distances at which collisions are detected, accurate to within the step size threshold.
         """
-        if step_size < step_size_threshold or distance - step_size / 2 < step_size_threshold:
-            return distance
-        detailed_x = self.x + (distance - step_size / 2) * np.cos(np.deg2rad(angle))
-        detailed_y = self.y + (distance - step_size / 2) * np.sin(np.deg2rad(angle))
-        if group.collides(detailed_x, detailed_y):
-            return self.detailed_distance(group, distance - step_size / 2, angle, step_size / 2, step_size_threshold)
-        else:
-            return self.detailed_distance(group, distance, angle, step_size / 2, step_size_threshold)
+        high = np.asarray(distance, dtype=float)
+        low = np.maximum(high - step_size, 0)
+        iterations = max(math.ceil(math.log2(step_size / step_size_threshold)), 0)
+        for _ in range(iterations):
+            mid = (low + high) * 0.5
+            hit = group.collides_array(self.x + mid * cos_a, self.y + mid * sin_a)
+            high = np.where(hit, mid, high)
+            low = np.where(hit, low, mid)
+        return high
 
     def render(self, step_size: float = 1, max_distance: float = 100, detailisation: float = 1, *geometry_groups: int) -> list[tuple[float, float]]:
-        beam_ends = []
-
-        # Spatial grid for geometry groups
-        spatial_grid = utils.SpatialGrid(cell_size=100)  # Adjust cell size as needed
-        for group_index, group in enumerate(geometry.groups):
-            if group_index in group_colors:
-                bounds = group.bounds  # Assuming the geometry group has a bounding box property
-                spatial_grid.add_geometry(group, bounds)
-
-        for beam_index, angle in enumerate(self.beam_angles):
-            distance = 0
-            collisions = []
-            collected_alpha = 0
-
-            # Clear pixel
-            pg.draw.line(self.viewport, (0, 0, 0, 255), (beam_index, 0), (beam_index, 0))
-
-            # Check collisions
-            while distance <= max_distance and collected_alpha < 255:
-                x = self.x + distance * np.cos(np.deg2rad(angle))
-                y = self.y + distance * np.sin(np.deg2rad(angle))
-
-                # Query the spatial grid for relevant geometry groups
-                nearby_groups = spatial_grid.query(x, y)
-
-                for group in nearby_groups:
-                    if geometry.groups.index(group) in group_colors and all(geometry.groups.index(group) != g for g, d in collisions):
-                        if group.collides(x, y):
-                            collisions.append((geometry.groups.index(group), self.detailed_distance(group, distance, angle, step_size, detailisation)))
-                            collected_alpha += group_colors[geometry.groups.index(group)][3]
-
-                distance += step_size
-
-            if collisions:
-                beam_ends.append((self.x + collisions[-1][1] * np.cos(np.deg2rad(angle)), self.y + collisions[-1][1] * np.sin(np.deg2rad(angle))))
-            else:
-                beam_ends.append((x, y))
-
-            # Draw collisions
-            for collision, distance in collisions[::-1]:
-                temp_surf = pg.Surface(self.viewport.get_size(), pg.SRCALPHA)
-                pg.draw.line(
-                    temp_surf,
-                    (
-                        group_colors[collision][0] * (1 - distance / max_distance),
-                        group_colors[collision][1] * (1 - distance / max_distance),
-                        group_colors[collision][2] * (1 - distance / max_distance),
-                        group_colors[collision][3],
-                    ),
-                    (beam_index, 0),
-                    (beam_index, 0),
-                )
-                self.viewport.blit(temp_surf, (0, 0))
+        """
+        Renders the scene to the viewport by ray marching all beams at once.
+
+        The sample points of every beam are computed as a (beams, steps) array, each geometry group is tested against all of them in one vectorized call, and the first hit of every group along every beam is then composited front to back until the collected alpha saturates.
+
+        Args:
+            step_size (float, optional): The step size for ray marching. Defaults to 1.
+            max_distance (float, optional): The maximum distance a beam travels before stopping. Defaults to 100.
+            detailisation (float, optional): The precision to which collision distances are refined. Defaults to 1.
+            *geometry_groups (int): The indices of the groups to render. Defaults to all colored groups.
+
+        Returns:
+            list[tuple[float, float]]: The end point of each beam.
+        """
+        # Single precision is plenty for the samples of pixel-sized beams and halves memory traffic
+        angles = self.beam_angles
+        cos_a, sin_a = self.beam_directions
+        # Samples up to the last one at or below max_distance, the small epsilon only absorbing division rounding
+        distances = (np.arange(int(max_distance / step_size + 1e-9) + 1) * step_size).astype(np.float32)
+
+        # Sample points of all beams, shape (beams, steps)
+        xs = self.x + cos_a[:, None] * distances[None, :]
+        ys = self.y + sin_a[:, None] * distances[None, :]
+
+        # Only groups near the area covered by the beams can be hit
+        nearby_groups = _update_spatial_index().query_area((xs.min(), ys.min(), xs.max(), ys.max()))
+        # The index only holds colored groups, so only a requested subset needs filtering
+        if geometry_groups:
+            active_groups = set(geometry_groups)
+            nearby_groups = [group for group in nearby_groups if group._index in active_groups]
+        candidates = [(group._index, group) for group in sorted(nearby_groups, key=lambda group: group._index)]
+        candidate_indices = np.array([group_index for group_index, _ in candidates], dtype=np.intp)
+        candidate_alphas = _color_array[candidate_indices, 3].astype(int)
+
+        # Bounding boxes of the candidates as columns, for the broad phase
+        candidate_bounds = _bounds_array[candidate_indices]
+
+        # Step index of the first hit of each candidate group along each beam, len(distances) if not hit
+        first_hits = np.full((len(angles), len(candidates)), len(distances), dtype=np.int64)
+
+        # Groups made only of circles are intersected exactly instead of being marched
+        analytic = np.array([not group._other_shapes for _, group in candidates], dtype=bool)
+        exact_distances = np.full(first_hits.shape, np.inf)
+        # Circles of all analytic candidates, intersected in one pass and ordered by candidate column
+        circle_groups = geometry.circles_group[:geometry.circle_count]
+        slots = np.flatnonzero(np.isin(circle_groups, candidate_indices[analytic]))
+        if len(slots):
+            slot_columns = np.searchsorted(candidate_indices, circle_groups[slots])
+            by_column = np.argsort(slot_columns, kind="stable")
+            slots, slot_columns = slots[by_column], slot_columns[by_column]
+            circle_distances = geometry.ray_circles_distance(self.x, self.y, cos_a, sin_a, slots)
+            # Each group is hit by its nearest circle
+            analytic_columns, column_starts = np.unique(slot_columns, return_index=True)
+            exact_distances[:, analytic_columns] = np.minimum.reduceat(circle_distances, column_starts, axis=1)
+            # Sort them in at the first sample on or behind the circle, as marching would
+            steps = np.ceil(exact_distances[:, analytic_columns] / step_size)
+            first_hits[:, analytic_columns] = np.where(steps < len(distances), steps, len(distances))
+
+        if self.backend == "cuda" or _kernels.NUMBA_AVAILABLE:
+            # Compiled march over all beams, steps and remaining shapes at once
+            kinds, params, shape_columns = _kernels.pack_shapes([group for _, group in candidates])
+            # Marched shapes nearest to the camera first, so opaque hits cut the march short early
+            marched = np.flatnonzero(~analytic[shape_columns])
+            marched = marched[np.argsort(np.hypot(params[marched, 0] - self.x, params[marched, 1] - self.y), kind="stable")]
+            # Steps of each beam within each group's bounding box, widened by a step against rounding
+            entries, exits = geometry.ray_boxes_interval(self.x, self.y, cos_a, sin_a, candidate_bounds)
+            step_ranges = np.empty(first_hits.shape + (2,), dtype=np.int64)
+            step_ranges[:, :, 0] = np.clip(np.floor(entries / step_size) - 1, 0, len(distances))
+            step_ranges[:, :, 1] = np.clip(np.ceil(exits / step_size) + 1, -1, len(distances) - 1)
+            raymarch = _kernels.raymarch_cuda if self.backend == "cuda" else _kernels.raymarch
+            raymarch(first_hits, kinds[marched], params[marched], shape_columns[marched], candidate_bounds, step_ranges, candidate_alphas >= 255, float(self.x), float(self.y), cos_a, sin_a, distances)
+        else:
+            marched_columns = np.flatnonzero(~analytic)
+            # Samples within each marched group's bounding box, shape (groups, beams, steps), in one broadcast
+            x_min, y_min, x_max, y_max = candidate_bounds[marched_columns, :, None, None].transpose(1, 0, 2, 3)
+            inside_all = (x_min <= xs) & (xs <= x_max) & (y_min <= ys) & (ys <= y_max)
+            # Beams are alive up to the first opaque circle they hit, nothing behind it needs to be sampled
+            limits = first_hits[:, candidate_alphas >= 255].min(axis=1, initial=len(distances))
+            inside_all &= np.arange(len(distances)) <= limits[:, None]
+
+            def march_group(column: int, inside: np.ndarray) -> None:
+                # Only samples within the group's bounding box need the exact collision check
+                if not inside.any():
+                    return
+                mask = np.zeros_like(inside)
+                mask[inside] = candidates[column][1].collides_array(xs[inside], ys[inside])
+                first_hits[:, column] = np.where(mask.any(axis=1), mask.argmax(axis=1), len(distances))
+
+            # Groups write separate columns of first_hits, so they can be marched concurrently
+            list(_worker_pool().map(march_group, marched_columns, inside_all))
+
+        # Order each beam's hits front to back
+        order = np.argsort(first_hits, axis=1, kind="stable")
+        sorted_steps = np.take_along_axis(first_hits, order, axis=1)
+        sorted_alphas = candidate_alphas[order]
+
+        # Alpha collected by a beam before the step of each hit, hits at the same step sharing the value of the first of them
+        collected_alphas = np.cumsum(sorted_alphas, axis=1) - sorted_alphas
+        columns = np.arange(len(candidates))
+        step_starts = np.ones(order.shape, dtype=bool)
+        step_starts[:, 1:] = sorted_steps[:, 1:] != sorted_steps[:, :-1]
+        step_start_columns = np.maximum.accumulate(np.where(step_starts, columns, 0), axis=1)
+        collected_alphas = np.take_along_axis(collected_alphas, step_start_columns, axis=1)
+
+        # A beam stops after the step at which it became opaque, so later hits are never refined
+        visible = (sorted_steps < len(distances)) & (collected_alphas < 255)
+        hit_counts = visible.sum(axis=1)
+
+        # Group indices and refined distances of each beam's collisions front to back, -1 where unused
+        hit_groups = np.full((len(angles), max(len(candidates), 1)), -1)
+        hit_distances = np.zeros(hit_groups.shape)
+        hit_beams, hits = np.nonzero(visible)
+        hit_columns = order[hit_beams, hits]
+        hit_groups[hit_beams, hits] = candidate_indices[hit_columns]
+        hit_distances[hit_beams, hits] = exact_distances[hit_beams, hit_columns]
+        # Hits of marched groups are refined together, one group at a time
+        for column in np.unique(hit_columns[~analytic[hit_columns]]):
+            selected = hit_columns == column
+            beams, refined = hit_beams[selected], hits[selected]
+            hit_distances[beams, refined] = self.detailed_distance(candidates[column][1], distances[sorted_steps[beams, refined]], cos_a[beams], sin_a[beams], step_size, detailisation)
+
+        # Beams end at their farthest collision, or at their last sample if nothing was hit
+        end_distances = np.where(hit_counts > 0, hit_distances[np.arange(len(angles)), hit_counts - 1], distances[-1])
+        beam_ends = list(zip((self.x + end_distances * cos_a).tolist(), (self.y + end_distances * sin_a).tolist()))
+
+        # Composite collisions of all beams over black with the over operator, unrolled into a weighted sum:
+        # each hit contributes its alpha times the transmittance of the hits in front of it
+        colors = _color_array[hit_groups]
+        attenuation = np.clip(1 - hit_distances / max_distance, 0, 1)
+        alpha = np.where(hit_groups >= 0, colors[:, :, 3] / 255, 0)
+        transmittance = np.ones(alpha.shape)
+        np.cumprod(1 - alpha[:, :-1], axis=1, out=transmittance[:, 1:])
+        # The weights are quantized to 8 fractional bits, matching the precision of the 8 bit output, so the colors are blended in integer arithmetic
+        weights = np.rint(attenuation * alpha * transmittance * 256).astype(np.uint16)
+        rgb = (colors[:, :, :3] * weights[:, :, None]).sum(axis=1, dtype=np.uint32) >> 8
+        # Each weight rounds up by at most half a step, so a sum of them can exceed 256 and must not wrap around in the 8 bit output
+        np.minimum(rgb, 255, out=rgb)
+        self._pixels[:len(rgb), 0] = rgb[:len(self._pixels)]
+
+        pg.surfarray.blit_array(self.viewport, self._pixels)
 
         return beam_ends
 
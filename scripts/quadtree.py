@@ -0,0 +1,195 @@
+"""
+Quadtree module
+Provides a point-region quadtree for spatially indexing geometry groups
+"""
+
+class PRQuadtree:
+    """
+    A point-region quadtree indexing geometry groups by their bounding boxes.
+
+    Leaves split into four equally sized quadrants once they hold more than max_per_leaf items. An item is stored once, in the deepest node whose quadrant alone holds its bounding box, so items straddling the split lines of a node stay at that node.
+
+    Attributes:
+        bounds (tuple[float, float, float, float]): The (x_min, y_min, x_max, y_max) region covered by the node.
+        max_per_leaf (int): The number of items a leaf holds before it is split.
+        max_depth (int): The depth below which leaves are no longer split.
+    """
+    def __init__(self, bounds: tuple[float, float, float, float], max_per_leaf: int = 8, max_depth: int = 8) -> None:
+        self.bounds = bounds
+        self.max_per_leaf = max_per_leaf
+        self.max_depth = max_depth
+
+        self.items = []
+        self.children = None
+
+    def insert(self, group, aabb: tuple[float, float, float, float]) -> None:
+        """
+        Inserts a geometry group into the deepest node whose quadrant holds its bounding box.
+
+        Args:
+            group: The geometry group to insert.
+            aabb (tuple[float, float, float, float]): The (x_min, y_min, x_max, y_max) bounding box of the group.
+        """
+        if not _overlaps(self.bounds, aabb):
+            return
+        node = self
+        while node.children is not None:
+            quadrant = node._quadrant(aabb)
+            if quadrant is None:
+                break
+            node = node.children[quadrant]
+        node.items.append((group, aabb))
+        if node.children is None and len(node.items) > node.max_per_leaf and node.max_depth > 0:
+            node._split()
+
+    def remove(self, group, aabb: tuple[float, float, float, float]) -> None:
+        """
+        Removes a geometry group from the node it was inserted into with a bounding box.
+
+        Args:
+            group: The geometry group to remove.
+            aabb (tuple[float, float, float, float]): The (x_min, y_min, x_max, y_max) bounding box the group was inserted with.
+        """
+        node = self
+        while node is not None:
+            items = [item for item in node.items if item[0] is not group]
+            if len(items) < len(node.items):
+                node.items = items
+                return
+            quadrant = node._quadrant(aabb) if node.children is not None else None
+            node = node.children[quadrant] if quadrant is not None else None
+
+    def contains(self, aabb: tuple[float, float, float, float]) -> bool:
+        """
+        Checks whether a bounding box lies entirely within the region covered by the tree.
+
+        Args:
+            aabb (tuple[float, float, float, float]): The (x_min, y_min, x_max, y_max) bounding box to check.
+
+        Returns:
+            bool: True if the bounding box lies within the tree's bounds, False otherwise.
+        """
+        return self.bounds[0] <= aabb[0] and self.bounds[1] <= aabb[1] and aabb[2] <= self.bounds[2] and aabb[3] <= self.bounds[3]
+
+    def query_point(self, x: float, y: float):
+        """
+        Iterates over the geometry groups whose bounding box contains a point.
+
+        Args:
+            x (float): The x-coordinate of the query point.
+            y (float): The y-coordinate of the query point.
+
+        Yields:
+            The geometry groups whose bounding box contains the point.
+        """
+        node = self
+        if not _overlaps(node.bounds, (x, y, x, y)):
+            return
+        # Descend along the quadrants containing the point, checking the items held on the way
+        while node is not None:
+            for group, aabb in node.items:
+                if aabb[0] <= x <= aabb[2] and aabb[1] <= y <= aabb[3]:
+                    yield group
+            if node.children is None:
+                return
+            x_mid = (node.bounds[0] + node.bounds[2]) / 2
+            y_mid = (node.bounds[1] + node.bounds[3]) / 2
+            node = node.children[(x >= x_mid) + 2 * (y >= y_mid)]
+
+    def query_area(self, bounds: tuple[float, float, float, float]) -> set:
+        """
+        Gets the geometry groups whose bounding box overlaps an area.
+
+        Args:
+            bounds (tuple[float, float, float, float]): The (x_min, y_min, x_max, y_max) area to query.
+
+        Returns:
+            set: The geometry groups whose bounding box overlaps the area.
+        """
+        found = set()
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not _overlaps(node.bounds, bounds):
+                continue
+            found.update(group for group, aabb in node.items if _overlaps(aabb, bounds))
+            if node.children is not None:
+                stack.extend(node.children)
+        return found
+
+    def _split(self) -> None:
+        """
+        Splits a leaf into four quadrants and moves the items that fit into a single quadrant into it.
+        """
+        x_min, y_min, x_max, y_max = self.bounds
+        x_mid = (x_min + x_max) / 2
+        y_mid = (y_min + y_max) / 2
+        # Ordered so that the index of a point's quadrant is (x >= x_mid) + 2 * (y >= y_mid)
+        self.children = [
+            PRQuadtree(quadrant, self.max_per_leaf, self.max_depth - 1)
+            for quadrant in (
+                (x_min, y_min, x_mid, y_mid),
+                (x_mid, y_min, x_max, y_mid),
+                (x_min, y_mid, x_mid, y_max),
+                (x_mid, y_mid, x_max, y_max),
+            )
+        ]
+        items, self.items = self.items, []
+        for group, aabb in items:
+            quadrant = self._quadrant(aabb)
+            if quadrant is None:
+                self.items.append((group, aabb))
+            else:
+                self.children[quadrant].insert(group, aabb)
+
+    def _quadrant(self, aabb: tuple[float, float, float, float]) -> int | None:
+        """
+        Gets the quadrant of the node holding a bounding box entirely.
+
+        Points on a split line belong to the upper quadrant, matching query_point, so boxes touching the line from below straddle it.
+
+        Args:
+            aabb (tuple[float, float, float, float]): The (x_min, y_min, x_max, y_max) bounding box.
+
+        Returns:
+            int | None: The index of the quadrant, or None if the bounding box straddles a split line.
+        """
+        x_mid = (self.bounds[0] + self.bounds[2]) / 2
+        y_mid = (self.bounds[1] + self.bounds[3]) / 2
+        if aabb[2] < x_mid:
+            x_side = 0
+        elif aabb[0] >= x_mid:
+            x_side = 1
+        else:
+            return None
+        if aabb[3] < y_mid:
+            y_side = 0
+        elif aabb[1] >= y_mid:
+            y_side = 2
+        else:
+            return None
+        return x_side + y_side
+
+def _overlaps(a: tuple[float, float, float, float], b: tuple[float, float, float, float]) -> bool:
+    """
+    Checks whether two (x_min, y_min, x_max, y_max) boxes overlap.
+    """
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+if __name__ == "__main__":
+    # Boxes overlapping all four quadrants stay at the root instead of splitting the tree down to its full depth
+    tree = PRQuadtree((0, 0, 100, 100))
+    for i in range(20):
+        tree.insert(i, (40 + i, 40, 60 + i, 60))
+    leaves = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.children is None:
+            leaves += 1
+        else:
+            stack.extend(node.children)
+    print(leaves)
+    assert leaves <= 4
+    assert tree.query_area((0, 0, 100, 100)) == set(range(20))
+    assert sorted(tree.query_point(50, 50)) == list(range(11))
@@ -4,6 +4,8 @@ Utility module
 Provides miscellaneous additional functionality
 """
 
+import math
+from functools import lru_cache
 import pygame as pg
 
 def blit_aspect(target_surface: pg.Surface, source_surface: pg.Surface, 
@@ -21,8 +23,71 @@ def blit_aspect(target_surface: pg.Surface, source_surface: pg.Surface,
         right_margin_percent Margin on the right side as a percentage of target surface width.
         bottom_margin_percent Margin on the bottom side as a percentage of target surface height.
     """
+    scaled_surface, position = scale_aspect(target_surface.get_size(), source_surface,
+                                            left_margin_percent, top_margin_percent, right_margin_percent, bottom_margin_percent)
+
+    # Blit the scaled surface onto the target surface
+    target_surface.blit(scaled_surface, position)
+
+def scale_aspect(target_size: tuple[int, int], source_surface: pg.Surface, 
+                 left_margin_percent: float = 0.05, top_margin_percent: float = 0.05, 
+                 right_margin_percent: float = 0.05, bottom_margin_percent: float = 0.05,
+                 dest_surface: pg.Surface = None) -> tuple[pg.Surface, tuple[int, int]]:
+    """
+    Scales a source_surface to fit a target of the given size while preserving its aspect ratio and 
+    respecting margins defined as percentages of the target size, as blit_aspect does.
+
+    Callers blitting an unchanged source every frame can keep the result and only rescale when the source or target changes.
+
+    Args:
+        target_size The size of the surface that will be drawn on.
+        source_surface The surface to be scaled.
+        left_margin_percent Margin on the left side as a percentage of target width.
+        top_margin_percent Margin on the top side as a percentage of target height.
+        right_margin_percent Margin on the right side as a percentage of target width.
+        bottom_margin_percent Margin on the bottom side as a percentage of target height.
+        dest_surface A previously scaled surface to scale into, reused if it has the right size.
+
+    Returns:
+        The scaled surface and the position to blit it at.
+    """
+    src_width, src_height = source_surface.get_size()
+    scale_width, scale_height, x_pos, y_pos = _compute_layout(tuple(target_size), (src_width, src_height),
+                                                              left_margin_percent, top_margin_percent, right_margin_percent, bottom_margin_percent)
+
+    # Scale the source surface, unless it already has the right size
+    if (scale_width, scale_height) == (src_width, src_height):
+        scaled_surface = source_surface
+    elif dest_surface is not None and dest_surface.get_size() == (scale_width, scale_height):
+        scaled_surface = pg.transform.scale(source_surface, (scale_width, scale_height), dest_surface)
+    else:
+        scaled_surface = pg.transform.scale(source_surface, (scale_width, scale_height))
+
+    return scaled_surface, (x_pos, y_pos)
+
+@lru_cache(maxsize=8)
+def _compute_layout(target_size: tuple[int, int], source_size: tuple[int, int], 
+                    left_margin_percent: float, top_margin_percent: float, 
+                    right_margin_percent: float, bottom_margin_percent: float) -> tuple[int, int, int, int]:
+    """
+    Calculates where a source is placed when fitted into a target while preserving its aspect ratio and 
+    respecting margins defined as percentages of the target size.
+
+    The layout only changes when a window is resized, so it is cached for the few sizes in use.
+
+    Args:
+        target_size The size of the target (width, height).
+        source_size The size of the source (width, height).
+        left_margin_percent Margin on the left side as a percentage of target width.
+        top_margin_percent Margin on the top side as a percentage of target height.
+        right_margin_percent Margin on the right side as a percentage of target width.
+        bottom_margin_percent Margin on the bottom side as a percentage of target height.
+
+    Returns:
+        The scaled width and height of the source, and the x and y position of its top left corner in the target.
+    """
     # Calculate the margins in pixels
-    width, height = target_surface.get_size()
+    width, height = target_size
     left_margin = int(width * left_margin_percent)
     top_margin = int(height * top_margin_percent)
     right_margin = int(width * right_margin_percent)
@@ -32,8 +97,8 @@ def blit_aspect(target_surface: pg.Surface, source_surface: pg.Surface,
     available_width = width - left_margin - right_margin
     available_height = height - top_margin - bottom_margin
 
-    # Get the original dimensions of the source surface
-    src_width, src_height = source_surface.get_size()
+    # Get the original dimensions of the source
+    src_width, src_height = source_size
 
     # Calculate the scaled dimensions preserving the aspect ratio
     scale_width = available_width
@@ -43,15 +108,11 @@ def blit_aspect(target_surface: pg.Surface, source_surface: pg.Surface,
         scale_height = available_height
         scale_width = int(src_width * (available_height / src_height))
 
-    # Scale the source surface
-    scaled_surface = pg.transform.scale(source_surface, (scale_width, scale_height))
-
-    # Calculate the position to center the scaled surface within the available area
+    # Calculate the position to center the scaled source within the available area
     x_pos = left_margin + (available_width - scale_width) // 2
     y_pos = top_margin + (available_height - scale_height) // 2
 
-    # Blit the scaled surface onto the target surface
-    target_surface.blit(scaled_surface, (x_pos, y_pos))
+    return scale_width, scale_height, x_pos, y_pos
 
 def screen_to_display_position(screen_position: tuple[int, int], display_size: tuple[int, int], 
                                screen_size: tuple[int, int], 
@@ -69,31 +130,10 @@ def screen_to_display_position(screen_position: tuple[int, int], display_size: t
     :param bottom_margin_percent: Margin on the bottom side as a percentage of screen height.
     :return: The translated position relative to the display surface (x, y).
     """
-    # Calculate the margins in pixels
-    width, height = screen_size
-    left_margin = int(width * left_margin_percent)
-    top_margin = int(height * top_margin_percent)
-    right_margin = int(width * right_margin_percent)
-    bottom_margin = int(height * bottom_margin_percent)
-
-    # Calculate the available area after applying margins
-    available_width = width - left_margin - right_margin
-    available_height = height - top_margin - bottom_margin
-
-    # Get the size of the display surface
+    # Get the size and position of the display surface on the screen
     display_width, display_height = display_size
-
-    # Calculate the scale factors based on the display size
-    scale_width = available_width
-    scale_height = int(display_height * (available_width / display_width))
-
-    if scale_height > available_height:
-        scale_height = available_height
-        scale_width = int(display_width * (available_height / display_height))
-
-    # Calculate the position of the display surface on the screen
-    display_x = left_margin + (available_width - scale_width) // 2
-    display_y = top_margin + (available_height - scale_height) // 2
+    scale_width, scale_height, display_x, display_y = _compute_layout(tuple(screen_size), tuple(display_size),
+                                                                      left_margin_percent, top_margin_percent, right_margin_percent, bottom_margin_percent)
 
     # Get the position on the screen relative to the display
     screen_x, screen_y = screen_position
@@ -108,6 +148,37 @@ def screen_to_display_position(screen_position: tuple[int, int], display_size: t
 
     return x_pos, y_pos
 
+def display_to_screen_rect(display_rect: pg.Rect, display_size: tuple[int, int], 
+                           screen_size: tuple[int, int], 
+                           left_margin_percent: float = 0.05, top_margin_percent: float = 0.05, 
+                           right_margin_percent: float = 0.05, bottom_margin_percent: float = 0.05) -> pg.Rect:
+    """
+    Translates a rectangle on the smaller display surface into the rectangle it covers on the screen.
+
+    :param display_rect: The rectangle on the display surface.
+    :param display_size: The size of the display surface (width, height).
+    :param screen_size: The size of the screen (width, height).
+    :param left_margin_percent: Margin on the left side as a percentage of screen width.
+    :param top_margin_percent: Margin on the top side as a percentage of screen height.
+    :param right_margin_percent: Margin on the right side as a percentage of screen width.
+    :param bottom_margin_percent: Margin on the bottom side as a percentage of screen height.
+    :return: The translated rectangle on the screen, rounded outwards to whole pixels.
+    """
+    # Get the size and position of the display surface on the screen
+    display_width, display_height = display_size
+    scale_width, scale_height, display_x, display_y = _compute_layout(tuple(screen_size), tuple(display_size),
+                                                                      left_margin_percent, top_margin_percent, right_margin_percent, bottom_margin_percent)
+
+    # Scale the rectangle's edges onto the screen
+    x_scale = scale_width / display_width
+    y_scale = scale_height / display_height
+    left = display_x + math.floor(display_rect.left * x_scale)
+    top = display_y + math.floor(display_rect.top * y_scale)
+    right = display_x + math.ceil(display_rect.right * x_scale)
+    bottom = display_y + math.ceil(display_rect.bottom * y_scale)
+
+    return pg.Rect(left, top, right - left, bottom - top)
+
 
 def draw_rectangle(surface, corner1, corner2, color, width=0):
 	"""
@@ -119,6 +190,9 @@ def draw_rectangle(surface, corner1, corner2, color, width=0):
 		corner2: A tuple (x2, y2) representing the opposite corner of the rectangle.
 		color: The color of the rectangle (e.g., (255, 0, 0) for red).
 		width: The width of the rectangle's outline. Defaults to 0 (filled rectangle).
+
+	Returns:
+		The bounding rectangle of the changed pixels.
 	"""
 	# Calculate the top-left corner and dimensions of the rectangle
 	x1, y1 = corner1
@@ -132,7 +206,27 @@ def draw_rectangle(surface, corner1, corner2, color, width=0):
 	rectangle = pg.Rect(top_left_x, top_left_y, width_rect, height_rect)
 
 	# Draw the rectangle on the surface
-	pg.draw.rect(surface, color, rectangle, width)
+	return pg.draw.rect(surface, color, rectangle, width)
+
+def draw_rectangle_fast(surface, x, y, w, h, color, width=0):
+	"""
+	Draws a rectangle on the given surface based on its top left corner and dimensions.
+
+	Faster than draw_rectangle for callers that already know the rectangle's top left corner.
+
+	Args:
+		surface: The Pygame surface to draw on.
+		x: The x-coordinate of the top left corner of the rectangle.
+		y: The y-coordinate of the top left corner of the rectangle.
+		w: The width of the rectangle.
+		h: The height of the rectangle.
+		color: The color of the rectangle (e.g., (255, 0, 0) for red).
+		width: The width of the rectangle's outline. Defaults to 0 (filled rectangle).
+
+	Returns:
+		The bounding rectangle of the changed pixels.
+	"""
+	return pg.draw.rect(surface, color, (x, y, w, h), width)
 
 import pygame
 
@@ -146,6 +240,9 @@ def draw_circle(surface, corner1, corner2, color, width=0):
 		corner2: A tuple (x2, y2) representing the opposite corner of the rectangle.
 		color: The color of the circle (e.g., (255, 0, 0) for red).
 		width: The width of the circle's outline. Defaults to 0 (filled circle).
+
+	Returns:
+		The bounding rectangle of the changed pixels.
 	"""
 	# Calculate the center and diameter of the circle
 	x1, y1 = corner1
@@ -153,45 +250,8 @@ def draw_circle(surface, corner1, corner2, color, width=0):
 	center_x = (x1 + x2) / 2
 	center_y = (y1 + y2) / 2
 
-	# Determine the smaller side length for the diameter
-	diameter = min(abs(x2 - x1), abs(y2 - y1))
+	# Determine the radius from the smaller side length, as an integer so SDL draws it without its float path
+	radius = int(min(abs(x2 - x1), abs(y2 - y1))) >> 1
 
 	# Draw the circle on the surface
-	pygame.draw.circle(surface, color, (int(center_x), int(center_y)), diameter // 2, width)
-
-class SpatialGrid:
-    """
-    A spatial grid for grouping geometry groups based on their position.
-
-    Attributes:
-        cell_size: The size of each cell in the grid.
-    """
-    def __init__(self, cell_size: float):
-        self.cell_size = cell_size
-        self.grid = {}
-
-    def add_geometry(self, geometry_group, bounds):
-        """
-        Add a geometry group to the grid based on its bounding box.
-        Args:
-            geometry_group: The geometry group to add.
-            bounds: A tuple (x_min, y_min, x_max, y_max) defining the bounding box of the group.
-        """
-        x_min, y_min, x_max, y_max = bounds
-        for x in range(int(x_min // self.cell_size), int(x_max // self.cell_size) + 1):
-            for y in range(int(y_min // self.cell_size), int(y_max // self.cell_size) + 1):
-                if (x, y) not in self.grid:
-                    self.grid[(x, y)] = []
-                self.grid[(x, y)].append(geometry_group)
-
-    def query(self, x, y):
-        """
-        Get geometry groups in the cell containing point (x, y).
-        Args:
-            x: The x-coordinate of the query point.
-            y: The y-coordinate of the query point.
-        Returns:
-            List of geometry groups in the relevant cell.
-        """
-        cell = (int(x // self.cell_size), int(y // self.cell_size))
-        return self.grid.get(cell, [])
+	return pygame.draw.circle(surface, color, (int(center_x), int(center_y)), radius, width)
@@ -4,11 +4,13 @@ Viewer module
 Deals with user interfacing for the program
 """
 
-import queue
+import ctypes
+import math
+from functools import lru_cache
 import multiprocessing
-import multiprocessing.queues
-import pygame as pg
+import multiprocessing.shared_memory
 import numpy as np
+import pygame as pg
 try:
     import scripts.geometry as geometry
     import scripts.graphics as graphics
@@ -22,8 +24,50 @@ MOVESPEED = 3
 TURNSPEED = 3
 SELECTION_COLOR = (200, 200, 200, 255)
 
+# Bits of the shared control mask of a viewer window, set while the matching key is held
+MOVE_FORWARD, MOVE_BACKWARD, MOVE_LEFT, MOVE_RIGHT, TURN_LEFT, TURN_RIGHT = 1, 2, 4, 8, 16, 32
+# Distances moved front/back and left/right, and angles turned, each frame a control bit is set
+_MOVE_CONTROLS = ((MOVE_FORWARD, -MOVESPEED, 0), (MOVE_BACKWARD, MOVESPEED, 0), (MOVE_LEFT, 0, -MOVESPEED), (MOVE_RIGHT, 0, MOVESPEED))
+_TURN_CONTROLS = ((TURN_LEFT, -TURNSPEED), (TURN_RIGHT, TURNSPEED))
+# Event types neither window handles, blocked so the event queues only carry what the loops read, the mouse position being polled instead
+_UNHANDLED_EVENTS = [pg.MOUSEMOTION, pg.TEXTINPUT, pg.TEXTEDITING]
+# Control bit held down by each key in a viewer window
+_KEY_CONTROLS = {
+    pg.K_w: MOVE_FORWARD,
+    pg.K_s: MOVE_BACKWARD,
+    pg.K_a: MOVE_LEFT,
+    pg.K_d: MOVE_RIGHT,
+    pg.K_q: TURN_LEFT,
+    pg.K_e: TURN_RIGHT
+}
+
 viewers = []
 
+# Reused layer for blending translucent groups in show_geometry
+_layer_surface = None
+# Incremented whenever show_geometry redraws, so scaled copies of the drawing know when to update
+_display_version = 0
+# The geometry groups as last drawn by show_geometry, and the geometry._index_version they were drawn at
+_geometry_surface = None
+_geometry_version = -1
+# White dot marking a viewer, blitted at the truncated viewer position it covers exactly what pg.draw.circle would
+_viewer_sprite = pg.Surface((11, 11), pg.SRCALPHA)
+pg.draw.circle(_viewer_sprite, (255, 255, 255, 255), (5, 5), 5)
+
+@lru_cache(maxsize=360)
+def _direction_heading(direction: float) -> tuple[float, float]:
+    """
+    Calculates the unit vector of a direction, kept for recently used directions as viewers turn in fixed steps.
+
+    Args:
+        direction (float): The direction in degrees, modulo 360.
+
+    Returns:
+        tuple[float, float]: The cosine and sine of the direction.
+    """
+    rad = math.radians(direction)
+    return math.cos(rad), math.sin(rad)
+
 class Viewer:
     """
     Viewer class, wrapper for graphics.Camera, used for users to interact with the scene
@@ -47,10 +91,14 @@ class Viewer:
         self.max_distance = max_distance
         self.step_size = step_size
         self.collision_detailisation = collision_detailisation
+        # Direction the heading vector (direction, cos, sin) used by move was last calculated for
+        self._heading = (None, 1.0, 0.0)
 
         self.camera = graphics.Camera(x, y, direction, field_of_view, resolution)
         # End points of the camera beams
         self.lasers = None
+        # The beams drawn onto a transparent surface, with its position and the lasers and target size it was drawn for
+        self._laser_layer = (None, (0, 0), None, None)
 
         self.viewport = self.camera.viewport
 
@@ -78,17 +126,47 @@ class Viewer:
             front_back (float): The distance to move forward or backward.
             left_right (float): The distance to move left or right.
         """
-        # Convert direction from degrees to radians
-        rad = np.deg2rad(self.direction)
+        # Look up the heading vector only when the direction changed since the last move, as viewers turn in steps it is mostly cached
+        if self._heading[0] != self.direction:
+            self._heading = (self.direction, *_direction_heading(self.direction % 360))
+        _, cos_a, sin_a = self._heading
 
         # Calculate the movement in x and y
-        dx = -front_back * np.cos(rad) - left_right * np.sin(rad)
-        dy = -front_back * np.sin(rad) + left_right * np.cos(rad)
+        dx = -front_back * cos_a - left_right * sin_a
+        dy = -front_back * sin_a + left_right * cos_a
 
         # Update position
         self.x += dx
         self.y += dy
     
+    def get_laser_layer(self, size: tuple[int, int]) -> tuple[pg.Surface, tuple[int, int]]:
+        """
+        Gets the beams of the viewer drawn as white lines onto a transparent surface covering just the beams.
+
+        The surface is only redrawn when the lasers changed, so viewers that did not update since the last call are blitted instead of drawn again.
+
+        Args:
+            size (tuple[int, int]): The size of the surface the layer is blitted onto, the beams being clipped to it.
+
+        Returns:
+            tuple[pg.Surface, tuple[int, int]]: The laser surface and the position of its top left corner.
+        """
+        if self._laser_layer[2] is not self.lasers or self._laser_layer[3] != size:
+            xs = [self.x] + [laser[0] for laser in self.lasers]
+            ys = [self.y] + [laser[1] for laser in self.lasers]
+            # Integer offset with a pixel of padding, the layer only shrinking where the beams leave the target surface,
+            # so the lines are rasterized and clipped exactly as they would be on the target surface
+            left = max(math.floor(min(xs)) - 1, 0)
+            top = max(math.floor(min(ys)) - 1, 0)
+            right = min(math.ceil(max(xs)) + 1, size[0])
+            bottom = min(math.ceil(max(ys)) + 1, size[1])
+            surface = pg.Surface((max(right - left, 0), max(bottom - top, 0)), pg.SRCALPHA)
+            origin = (self.x - left, self.y - top)
+            for laser in self.lasers:
+                pg.draw.line(surface, (255, 255, 255, 255), origin, (laser[0] - left, laser[1] - top), 1)
+            self._laser_layer = (surface, (left, top), self.lasers, size)
+        return self._laser_layer[0], self._laser_layer[1]
+
     def turn(self, angle: float) -> None:
         """
         Turns the viewer by the given angle in degrees.
@@ -98,6 +176,33 @@ class Viewer:
         """
         self.direction += angle
 
+def _get_layer_surface(size: tuple[int, int]) -> pg.Surface:
+    """
+    Gets the transparent layer used to blend translucent groups, reallocating it only when the size changes.
+
+    Args:
+        size (tuple[int, int]): The size of the surface the layer is blended onto.
+
+    Returns:
+        pg.Surface: The layer surface, fully transparent as long as users clear what they draw on it.
+    """
+    global _layer_surface
+    if _layer_surface is None or _layer_surface.get_size() != size:
+        _layer_surface = pg.Surface(size, pg.SRCALPHA)
+    return _layer_surface
+
+def _draw_circle(surface: pg.Surface, color: tuple[int, int, int, int], circle: geometry.GeoCircle) -> pg.Rect:
+    """
+    Draws a circle geometry on the given surface, returning the bounding rectangle of the changed pixels.
+    """
+    return pg.draw.circle(surface, color, (circle.x, circle.y), circle.radius)
+
+def _draw_rectangle(surface: pg.Surface, color: tuple[int, int, int, int], rectangle: geometry.GeoRectangle) -> pg.Rect:
+    """
+    Draws a rectangle geometry on the given surface, returning the bounding rectangle of the changed pixels.
+    """
+    return utils.draw_rectangle_fast(surface, rectangle.x - rectangle.width / 2, rectangle.y - rectangle.height / 2, rectangle.width, rectangle.height, color)
+
 def show_geometry(surface: pg.Surface) -> None:
     """
     Shows the geometry of the scene on the given surface.
@@ -107,87 +212,119 @@ def show_geometry(surface: pg.Surface) -> None:
     Args:
         surface (pg.Surface): The surface to draw on.
     """
-    surface.fill((0, 0, 0, 255))
-    # Draw geometry (in reversed alpha order for transparency)
-    for group_index, group_color in sorted(graphics.group_colors.items(), key=lambda x: x[1][3], reverse=True):
-        # Temporary surface for transparency blending
-        temp_surf = pg.Surface(surface.get_size(), pg.SRCALPHA)
-        group = geometry.groups[group_index]
-        for shape in group.shapes:
-            if type(shape) == geometry.GeoCircle:
-                pg.draw.circle(temp_surf, group_color, (shape.x, shape.y), shape.radius)
-            elif type(shape) == geometry.GeoRectangle:
-                pg.draw.rect(temp_surf, group_color, pg.Rect(shape.x - shape.width / 2, shape.y - shape.height / 2, shape.width, shape.height))
-        surface.blit(temp_surf, (0, 0))
+    global _display_version, _geometry_surface, _geometry_version
+    _display_version += 1
+
+    # Only redraw the geometry when a group or group color changed since it was last drawn, as mostly just the viewers move
+    if _geometry_surface is None or _geometry_surface.get_size() != surface.get_size() or _geometry_version != geometry._index_version:
+        if _geometry_surface is None or _geometry_surface.get_size() != surface.get_size():
+            _geometry_surface = pg.Surface(surface.get_size(), pg.SRCALPHA)
+        _geometry_version = geometry._index_version
+        _geometry_surface.fill((0, 0, 0, 255))
+        # Draw geometry (in reversed alpha order for transparency)
+        for group_index, group_color in graphics._group_colors_by_alpha:
+            # Opaque groups are drawn directly, translucent ones on a layer for transparency blending, as pygame draws do not blend
+            if group_color[3] == 255:
+                target = _geometry_surface
+            else:
+                target = _get_layer_surface(surface.get_size())
+            group = geometry.groups[group_index]
+            drawn_rects = [_draw_circle(target, group_color, circle) for circle in group.circles]
+            drawn_rects += [_draw_rectangle(target, group_color, rectangle) for rectangle in group.rectangles]
+            # Only the area the group was drawn on is blended, and cleared again for the next group
+            if target is not _geometry_surface and drawn_rects:
+                drawn_rect = drawn_rects[0].unionall(drawn_rects[1:])
+                _geometry_surface.blit(target, drawn_rect, drawn_rect)
+                target.fill((0, 0, 0, 0), drawn_rect)
+    surface.blit(_geometry_surface, (0, 0))
     
-    # Draw viewers
-    for viewer in viewers:
-        pg.draw.circle(surface, (255, 255, 255, 255), (viewer.x, viewer.y), 5)
-        for laser in viewer.lasers:
-            pg.draw.line(surface, (255, 255, 255, 255), (viewer.x, viewer.y), laser, 1)
+    # Draw viewers as sprites, with their beams from the cached laser layers, in a single batch
+    viewer_blits = [(_viewer_sprite, (int(viewer.x) - 5, int(viewer.y) - 5)) for viewer in viewers]
+    viewer_blits += [viewer.get_laser_layer(surface.get_size()) for viewer in viewers]
+    surface.blits(viewer_blits, doreturn=False)
+
+def send_view(viewer: Viewer, shared_view: np.ndarray, frame_event: multiprocessing.Event) -> None:
+    """
+    Copies the viewport of a viewer into the shared memory read by its window, and signals the window that a new frame is available.
 
-def create_viewer_window(resolution: int, control: dict, display_queue: multiprocessing.Queue) -> None:
+    Args:
+        viewer (Viewer): The viewer whose viewport is sent.
+        shared_view (np.ndarray): The (resolution, 1, 3) view of the shared memory of the viewer's window.
+        frame_event (multiprocessing.Event): The event signaling the viewer's window that a new frame is available.
+    """
+    pixels = pg.surfarray.pixels3d(viewer.viewport)
+    shared_view[:] = pixels
+    # Release the surface lock held by the pixel view
+    del pixels
+    frame_event.set()
+
+def create_viewer_window(resolution: int, control: ctypes.c_uint8, quit_flag: ctypes.c_bool, shared_name: str, frame_event: multiprocessing.Event) -> None:
     """
     Creates a separate window for displaying the view of a single viewer.
 
-    The function starts a new Pygame window and enters a loop where it checks for commands in the control queue, processes events, and updates the display.
+    The function starts a new Pygame window and enters a loop where it processes events into the control mask, and updates the display.
 
-    The function exits when it receives the "quit" command in the control queue, and then calls pg.quit().
+    The function exits when the quit flag is set, and then calls pg.quit().
 
     Args:
         resolution (int): The resolution/width of the display surface.
-        control_queue (multiprocessing.Queue): A queue to send and receive commands from the main process.
-        display_queue (multiprocessing.Queue): A queue to receive the viewer viewport from the main process.
+        control (ctypes.c_uint8): The shared mask of held control bits, only written by the window.
+        quit_flag (ctypes.c_bool): The shared flag set by the main process to close the window.
+        shared_name (str): The name of the shared memory the main process writes the viewer viewport to.
+        frame_event (multiprocessing.Event): The event set by the main process when a new viewport is written to the shared memory.
     """
+    shared_memory = multiprocessing.shared_memory.SharedMemory(name=shared_name)
+    shared_view = np.ndarray((resolution, 1, 3), dtype=np.uint8, buffer=shared_memory.buf)
+
     pg.init()
     pg.display.set_caption(f"Viewer View")
     screen = pg.display.set_mode((500, 50), pg.RESIZABLE)
+    pg.event.set_blocked(_UNHANDLED_EVENTS)
     clock = pg.time.Clock()
     running = True
 
     display = pg.Surface((resolution, 1), pg.SRCALPHA)
+    # Held control bits, kept locally and published to the shared mask as a whole, so the window is its only writer
+    control_mask = 0
+    # Size the window was last drawn at, and whether it has to be redrawn even without a new frame
+    drawn_size = None
+    exposed = True
 
     while running:
-        if control["quit"]:
+        if quit_flag.value:
             running = False
         
         for event in pg.event.get():
-            if event.type == pg.KEYDOWN:
-                if event.key == pg.K_w:
-                    control["move-forward"] = True
-                if event.key == pg.K_s:
-                    control["move-backward"] = True
-                if event.key == pg.K_a:
-                    control["move-left"] = True
-                if event.key == pg.K_d:
-                    control["move-right"] = True
-                if event.key == pg.K_q:
-                    control["turn-left"] = True
-                if event.key == pg.K_e:
-                    control["turn-right"] = True
-            if event.type == pg.KEYUP:
-                if event.key == pg.K_w:
-                    control["move-forward"] = False
-                if event.key == pg.K_s:
-                    control["move-backward"] = False
-                if event.key == pg.K_a:
-                    control["move-left"] = False
-                if event.key == pg.K_d:
-                    control["move-right"] = False
-                if event.key == pg.K_q:
-                    control["turn-left"] = False
-                if event.key == pg.K_e:
-                    control["turn-right"] = False
+            if event.type in (pg.VIDEOEXPOSE, pg.WINDOWEXPOSED):
+                exposed = True
+            if event.type in (pg.KEYDOWN, pg.KEYUP):
+                bit = _KEY_CONTROLS.get(event.key)
+                if bit is not None:
+                    if event.type == pg.KEYDOWN:
+                        control_mask |= bit
+                    else:
+                        control_mask &= ~bit
+                    control.value = control_mask
         
-        if not display_queue.empty():
-            pg.surfarray.blit_array(display, display_queue.get())
+        new_frame = frame_event.is_set()
+        if new_frame:
+            frame_event.clear()
+            pg.surfarray.blit_array(display, shared_view)
 
-        screen.fill((0, 0, 0))
-        screen.blit(pg.transform.scale(display, screen.get_size()), (0, 0))
-        pg.display.flip()
+        if drawn_size != screen.get_size():
+            drawn_size = screen.get_size()
+            exposed = True
+
+        # Only redraw the window when its contents changed, scaling the display directly onto it
+        if new_frame or exposed:
+            exposed = False
+            pg.transform.scale(display, screen.get_size(), screen)
+            pg.display.flip()
 
         clock.tick(60)
     
+    del shared_view
+    shared_memory.close()
     pg.quit()
 
 def spawn_rectangle_from_selection(selection: list[tuple[int, int], tuple[int, int]], color: tuple[int, int, int, int] = SELECTION_COLOR) -> None:
@@ -239,48 +376,60 @@ def start():
     pg.init()
     pg.display.set_caption("Geometry View")
     screen = pg.display.set_mode((500, 500), pg.RESIZABLE)
+    pg.event.set_blocked(_UNHANDLED_EVENTS)
     clock = pg.time.Clock()
     running = True
 
     display = pg.Surface((500, 500), pg.SRCALPHA)
     selection_layer = pg.Surface(display.get_size(), pg.SRCALPHA)
 
-    manager = multiprocessing.Manager()
+    # Control masks and quit flags of each viewer window, in shared memory so reading them needs no round trip to another process
     controls = []
-    display_queues = []
-    for viewer in viewers:
-        control = manager.dict({
-            "move-forward": False,
-            "move-backward": False,
-            "move-left": False,
-            "move-right": False,
-            "turn-left": False,
-            "turn-right": False,
-            "quit": False
-        })
-        controls.append(control)
-        display_queues.append(multiprocessing.Queue())
-        multiprocessing.Process(target=create_viewer_window, args=(viewer.resolution, controls[-1], display_queues[-1])).start()
-
+    quit_flags = []
+    # Shared memory holding each viewer's viewport, with a view into it and an event signaling new frames to its window
+    shared_memories = []
+    shared_views = []
+    frame_events = []
     for viewer in viewers:
+        controls.append(multiprocessing.RawValue(ctypes.c_uint8))
+        quit_flags.append(multiprocessing.RawValue(ctypes.c_bool))
+        shared_memories.append(multiprocessing.shared_memory.SharedMemory(create=True, size=viewer.resolution * 3))
+        shared_views.append(np.ndarray((viewer.resolution, 1, 3), dtype=np.uint8, buffer=shared_memories[-1].buf))
+        frame_events.append(multiprocessing.Event())
+        multiprocessing.Process(target=create_viewer_window, args=(viewer.resolution, controls[-1], quit_flags[-1], shared_memories[-1].name, frame_events[-1])).start()
+
+    for viewer_index, viewer in enumerate(viewers):
         viewer.update()
-        display_queues[viewers.index(viewer)].put(pg.surfarray.array3d(viewer.viewport))
+        send_view(viewer, shared_views[viewer_index], frame_events[viewer_index])
 
-    screen.fill((0, 0, 0))
     show_geometry(display)
-    screen.blit(pg.transform.scale(display, screen.get_size()), (0, 0))
+    pg.transform.scale(display, screen.get_size(), screen)
     pg.display.flip()
 
+    # The display scaled to the screen, only rescaled when it was redrawn or the screen was resized
+    scaled_display = None
+    scaled_display_key = None
+
     left_mouse = False
     right_mouse = False
 
     left_selection = [(0, 0), (0, 0)]
     right_selection = [(0, 0), (0, 0)]
 
+    # State the screen was last drawn in, it is only redrawn when this changes
+    drawn_key = None
+    # Area of the display the selections were last drawn over
+    drawn_selection_rect = pg.Rect(0, 0, 0, 0)
+
     while running:
+        # Viewers to update this frame, so they are rendered and the geometry is redrawn at most once per frame
+        outdated = [False] * len(viewers)
+
         for event in pg.event.get():
             if event.type == pg.QUIT:
                 running = False
+            if event.type in (pg.VIDEOEXPOSE, pg.WINDOWEXPOSED):
+                drawn_key = None
             if event.type == pg.KEYDOWN:
                 if event.key == pg.K_ESCAPE:
                     running = False
@@ -293,62 +442,76 @@ def start():
                 if not pg.mouse.get_pressed()[0]:
                     left_mouse = False
                     spawn_rectangle_from_selection(left_selection)
-                    for viewer in viewers:
-                        viewer.update()
-                    show_geometry(display)
-                    for viewer in viewers:
-                        display_queues[viewers.index(viewer)].put(pg.surfarray.array3d(viewer.viewport))
+                    outdated = [True] * len(viewers)
                 if not pg.mouse.get_pressed()[2]:
                     right_mouse = False
                     spawn_circle_from_selection(right_selection)
-                    for viewer in viewers:
-                        viewer.update()
-                    show_geometry(display)
-                    for viewer in viewers:
-                        display_queues[viewers.index(viewer)].put(pg.surfarray.array3d(viewer.viewport))
+                    outdated = [True] * len(viewers)
         
+        # The mouse position on the display, translated once per frame
+        mouse_position = utils.screen_to_display_position(pg.mouse.get_pos(), display.get_size(), screen.get_size())
         if not left_mouse:
-            left_selection[0] = utils.screen_to_display_position(pg.mouse.get_pos(), display.get_size(), screen.get_size())
-        left_selection[1] = utils.screen_to_display_position(pg.mouse.get_pos(), display.get_size(), screen.get_size())
+            left_selection[0] = mouse_position
+        left_selection[1] = mouse_position
         if not right_mouse:
-            right_selection[0] = utils.screen_to_display_position(pg.mouse.get_pos(), display.get_size(), screen.get_size())
-        right_selection[1] = utils.screen_to_display_position(pg.mouse.get_pos(), display.get_size(), screen.get_size())
+            right_selection[0] = mouse_position
+        right_selection[1] = mouse_position
 
         for viewer_index, control in enumerate(controls):
+            # Only move and update viewers whose window holds a control
+            control_mask = control.value
+            if not control_mask:
+                continue
             viewer = viewers[viewer_index]
-            if control["move-forward"]:
-                viewer.move(-MOVESPEED, 0)
-            if control["move-backward"]:
-                viewer.move(MOVESPEED, 0)
-            if control["move-left"]:
-                viewer.move(0, -MOVESPEED)
-            if control["move-right"]:
-                viewer.move(0, MOVESPEED)
-            if control["turn-left"]:
-                viewer.turn(-TURNSPEED)
-            if control["turn-right"]:
-                viewer.turn(TURNSPEED)
-
-            # Only update displays when changes are made
-            if any(control.values()):
+            for bit, front_back, left_right in _MOVE_CONTROLS:
+                if control_mask & bit:
+                    viewer.move(front_back, left_right)
+            for bit, angle in _TURN_CONTROLS:
+                if control_mask & bit:
+                    viewer.turn(angle)
+            outdated[viewer_index] = True
+
+        for viewer_index, viewer in enumerate(viewers):
+            if outdated[viewer_index]:
                 viewer.update()
-
-                display_queues[viewer_index].put(pg.surfarray.array3d(viewer.viewport))
-
-                show_geometry(display)
-            
-        screen.fill((50, 50, 50))
-        utils.blit_aspect(screen, display)
-        selection_layer.fill((0, 0, 0, 0))
-        utils.draw_rectangle(selection_layer, *left_selection, SELECTION_COLOR, 2)
-        utils.draw_circle(selection_layer, *right_selection, SELECTION_COLOR, 2)
-        utils.blit_aspect(screen, selection_layer)
-        pg.display.flip()
+                send_view(viewer, shared_views[viewer_index], frame_events[viewer_index])
+        # Redrawn for moved viewers, and for geometry changed since the last draw even with no viewers open
+        if any(outdated) or _geometry_version != geometry._index_version:
+            show_geometry(display)
+
+        # Only redraw the screen when the geometry, the selections or the screen size changed
+        screen_key = (screen.get_size(), _display_version, tuple(left_selection), tuple(right_selection))
+        if screen_key != drawn_key:
+            # When only the selections changed, only the area they covered before and cover now is redrawn
+            only_selections = drawn_key is not None and drawn_key[:2] == screen_key[:2]
+            drawn_key = screen_key
+            selection_layer.fill((0, 0, 0, 0))
+            selection_rect = utils.draw_rectangle(selection_layer, *left_selection, SELECTION_COLOR, 2)
+            selection_rect.union_ip(utils.draw_circle(selection_layer, *right_selection, SELECTION_COLOR, 2))
+            if only_selections:
+                dirty_rect = utils.display_to_screen_rect(selection_rect.union(drawn_selection_rect), display.get_size(), screen.get_size()).inflate(2, 2).clip(screen.get_rect())
+                screen.set_clip(dirty_rect)
+            drawn_selection_rect = selection_rect
+            screen.fill((50, 50, 50))
+            if scaled_display_key != (screen.get_size(), _display_version):
+                scaled_display_key = (screen.get_size(), _display_version)
+                scaled_display, display_position = utils.scale_aspect(screen.get_size(), display, dest_surface=scaled_display)
+            screen.blit(scaled_display, display_position)
+            utils.blit_aspect(screen, selection_layer)
+            if only_selections:
+                screen.set_clip(None)
+                pg.display.update(dirty_rect)
+            else:
+                pg.display.flip()
 
         clock.tick(60)
     
-    for control in controls:
-        control["quit"] = True
+    for quit_flag in quit_flags:
+        quit_flag.value = True
+    del shared_views
+    for shared_memory in shared_memories:
+        shared_memory.close()
+        shared_memory.unlink()
     pg.quit()
 
 def add_viewer(x: float, y: float, direction: float, field_of_view: float, resolution: int, max_distance: float, step_size: int = 10, collision_detailisation: int = 1) -> Viewer: